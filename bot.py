@@ -2,12 +2,21 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import os
+import sys
 import asyncio
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
+from google.api_core.exceptions import NotFound
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import uuid # To generate unique task IDs
+import contextlib
+import copy
+import functools
+import heapq
+import time
+from bisect import bisect_right
 
 # --- Setup: Load Environment Variables ---
 load_dotenv()
@@ -25,7 +34,7 @@ try:
     firebase_admin.initialize_app(cred, {
         'databaseURL': FIREBASE_DATABASE_URL
     })
-    db = firestore.client()
+    db = firestore_async.client()
     print("Firebase connection successful.")
 except FileNotFoundError:
     print("Error: 'serviceAccountKey.json' not found.")
@@ -36,82 +45,499 @@ except Exception as e:
     exit()
 
 # --- Setup: Bot ---
-# We need all intents for full functionality (especially members and message content)
-intents = discord.Intents.all()
+# Only subscribe to what the bot uses: the defaults (guilds, DMs, ...) plus
+# message content for journal entries and members
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True
+intents.dm_messages = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
 # This will store active task timers
-# { 'user_id_task_id': asyncio.Task }
+# { (user_id, task_id): (fire_at, user, task_name) }
 active_timers = {}
+# One timer_loop task runs every timer, in fire_at order (time.monotonic() seconds)
+# [(fire_at, user_id, task_id), ...]
+# Cancelled timers are just removed from active_timers and skipped when they come up
+timer_heap = []
+timer_heap_changed = None # Created in setup_hook, like dm_outbox
+
+# User configs rarely change, so keep them in memory instead of reading Firestore on every command
+# { user_id: config_dict, or None if the user hasn't run /setup }
+config_cache = TTLCache(maxsize=10000, ttl=300)
+CONFIG_NOT_CACHED = object()
+# The config fields the bot reads (written by SetupModal)
+CONFIG_FIELDS = ('start_hour', 'journal_channel_id', 'positive_habits', 'negative_habits')
+# Config reads waiting to be sent in the next batched get_all()
+# { user_id: asyncio.Future resolving to the config snapshot }
+pending_config_reads = {}
+CONFIG_READ_WINDOW = 0.02 # Seconds to collect config reads before sending them
+
+# Schedules are kept in memory and written back to Firestore in the background
+# { (user_id, date_str): schedule_dict }
+schedule_cache = {}
+# Schedule writes waiting to be flushed
+# { (user_id, date_str): {field_path: value} or FULL_WRITE }
+dirty_schedules = {}
+FULL_WRITE = None # Marker for "set() the whole cached document"
+# One lock per schedule, so writes to the same schedule go out in order while different schedules don't wait on each other
+# { (user_id, date_str): asyncio.Lock }
+schedule_write_locks = {}
+MAX_BATCH_WRITES = 500 # Firestore's limit per batched write
+
+# Timer notifications are queued here and sent by DM_WORKERS dm_worker tasks,
+# so a burst of timers ending at once can't flood Discord's DM rate limits
+# (user, message)
+dm_outbox = None # Created in setup_hook, so it belongs to the loop the bot runs on
+DM_OUTBOX_SIZE = 1000
+DM_WORKERS = 5
+
+# Today's date string and the time.time() at which it goes stale (the next local midnight)
+# (expires_at, date_str)
+today_cache = (0.0, '')
+
+# /done task lists built in the last few seconds, for users running it repeatedly
+# { user_id: [discord.SelectOption, ...] }
+done_options_cache = TTLCache(maxsize=10000, ttl=5)
+
+# Keeps references to background tasks so they aren't garbage collected
+background_tasks = set()
+
+def build_slots(start_hour):
+    """Builds the 4 empty slots of a day starting at start_hour."""
+    slots = []
+    current_hour = start_hour
+    for i in range(4):
+        slots.append({
+            'slot_number': i + 1,
+            'start_hour': current_hour,
+            'total_minutes': 240,
+            'remaining_minutes': 240
+        })
+        current_hour = (current_hour + 4) % 24
+    return slots
+
+# Empty slot lists for every possible start hour, copied for each new schedule
+# { start_hour: [slot, ...] }
+SCHEDULE_TEMPLATES = {hour: build_slots(hour) for hour in range(24)}
+
+# Question prefixes for common habits, matched by keyword (first match wins)
+POSITIVE_HABIT_PREFIXES = {
+    "gym": "Did you go to the",
+    "meditate": "Did you",
+    "protein": "Did you take your"
+}
+NEGATIVE_HABIT_PREFIXES = {
+    "smoke": "Did you avoid",
+    "sugary": "Did you avoid"
+}
+
+# Daily summary tiers: (minimum percentage, title, summary template), sorted by percentage
+SUMMARY_TIERS = [
+    (0, "The Day of Reflection", "It was a challenging day for {name}, with {score}/{total} habits met. Today is best used as a day of rest and reflection to come back stronger tomorrow."),
+    (sys.float_info.min, "The Uphill Battle", "{name} struggled with focus today, completing {score}/{total} habits. While it was a tough day, every completed habit is a small victory to build on."), # Anything above 0%
+    (40, "A Day of Mixed Results", "{name}'s day was a mix of wins and challenges, hitting {score}/{total} targets. This day provides valuable lessons on what to focus on tomorrow."),
+    (60, "The Steady Hand", "{name} had a solid day. With {score}/{total} habits completed, they built positive momentum and successfully navigated most of the day's challenges."),
+    (80, "The Master Practitioner", "{name} showed exceptional focus, achieving {score}/{total} of their goals. A few minor slips couldn't overshadow a day of strong commitment and progress."),
+    (100, "The Pinnacle of Discipline", "{name} had a perfect day, demonstrating flawless discipline. They completed all {total} goals, remaining steadfast and focused. An outstanding performance.")
+]
+SUMMARY_TIER_THRESHOLDS = [threshold for threshold, _, _ in SUMMARY_TIERS]
 
 # --- Helper Functions ---
 
+@functools.lru_cache(maxsize=4096)
+def get_user_doc_ref(user_id):
+    """Gets the Firestore doc reference for a user (cached, the refs below all hang off it)."""
+    return db.collection('users').document(str(user_id))
+
 def get_user_config_ref(user_id):
     """Gets the Firestore doc reference for a user's configuration."""
-    return db.collection('users').document(str(user_id)).collection('config').document('main')
+    return get_user_doc_ref(user_id).collection('config').document('main')
 
 def get_user_schedule_ref(user_id, date_str):
     """Gets the Firestore doc reference for a user's schedule on a specific date."""
-    return db.collection('users').document(str(user_id)).collection('schedules').document(date_str)
+    return get_user_doc_ref(user_id).collection('schedules').document(date_str)
 
 def get_user_habits_ref(user_id, date_str):
     """Gets the Firestore doc reference for a user's habits on a specific date."""
-    return db.collection('users').document(str(user_id)).collection('habits').document(date_str)
+    return get_user_doc_ref(user_id).collection('habits').document(date_str)
+
+async def load_config(user_id):
+    """Returns the user's config dict (cached), or None if they haven't run /setup."""
+    # Users without a config are cached as None too, so repeated commands before /setup cost nothing
+    config = config_cache.get(user_id, CONFIG_NOT_CACHED)
+    if config is not CONFIG_NOT_CACHED:
+        return config
+
+    config_doc = await fetch_config_doc(user_id)
+    config = config_doc.to_dict() if config_doc.exists else None
+    config_cache[user_id] = config
+    return config
+
+async def fetch_config_doc(user_id):
+    """
+    Reads a user's config snapshot from Firestore. Reads requested within
+    CONFIG_READ_WINDOW of each other are sent together in one get_all() call.
+    """
+    future = pending_config_reads.get(user_id)
+    if future is None:
+        start_batch = not pending_config_reads
+        future = asyncio.get_running_loop().create_future()
+        pending_config_reads[user_id] = future
+        if start_batch:
+            fire_and_forget(read_pending_configs())
+    # Shielded since several commands may be waiting on the same read
+    return await asyncio.shield(future)
+
+async def read_pending_configs():
+    """Collects config reads for a moment, then fetches them all in a single batched RPC."""
+    await asyncio.sleep(CONFIG_READ_WINDOW)
+    pending = dict(pending_config_reads)
+    pending_config_reads.clear()
+
+    refs = {user_id: get_user_config_ref(user_id) for user_id in pending}
+    user_ids_by_path = {ref.path: user_id for user_id, ref in refs.items()}
+    try:
+        # Only fetch the fields the bot uses, so the snapshots hold nothing else to convert
+        async for config_doc in db.get_all(list(refs.values()), field_paths=CONFIG_FIELDS):
+            future = pending[user_ids_by_path[config_doc.reference.path]]
+            if not future.done():
+                future.set_result(config_doc)
+        error = RuntimeError("Firestore returned no snapshot for this config")
+    except Exception as e:
+        error = e
+
+    for future in pending.values():
+        if not future.done():
+            future.set_exception(error)
+
+class SetupRequired(app_commands.CheckFailure):
+    """Raised by requires_setup() when the user hasn't run /setup yet."""
+
+def requires_setup():
+    """
+    Check for commands that need the user's config. Loads it (and prefetches today's
+    schedule at the same time) into interaction.extras['config'] and interaction.extras['schedule'].
+    """
+    async def predicate(interaction: discord.Interaction):
+        user_id = interaction.user.id
+        config = config_cache.get(user_id, CONFIG_NOT_CACHED)
+        if config is None:
+            # Known not to be set up, no need to touch Firestore at all
+            raise SetupRequired()
+        if config is CONFIG_NOT_CACHED:
+            # The config and schedule reads are independent, so run them concurrently
+            config, schedule_data = await asyncio.gather(
+                load_config(user_id),
+                load_schedule(user_id, get_today_date_str())
+            )
+            if config is None:
+                raise SetupRequired()
+        else:
+            schedule_data = await load_schedule(user_id, get_today_date_str())
+        interaction.extras['config'] = config
+        interaction.extras['schedule'] = schedule_data # None if there's no schedule for today yet
+        return True
+    return app_commands.check(predicate)
 
 def get_today_date_str():
-    """Returns today's date as 'YYYY-MM-DD'."""
-    return datetime.now().strftime('%Y-%m-%d')
+    """Returns today's date as 'YYYY-MM-DD'. Only formatted once a day, see today_cache."""
+    global today_cache
+    expires_at, today_str = today_cache
+    if time.time() < expires_at:
+        return today_str
+
+    now = datetime.now()
+    next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    today_cache = (next_midnight.timestamp(), now.strftime('%Y-%m-%d'))
+    return today_cache[1]
+
+def upgrade_legacy_schedule(schedule):
+    """
+    Moves the tasks of a schedule saved before 'tasks_by_id' existed (a 'tasks' list in each slot)
+    into 'tasks_by_id', keeping their order. Returns True if the schedule was changed.
+    """
+    if 'tasks_by_id' in schedule:
+        return False
+    tasks_by_id = {}
+    for slot in schedule.get('slots', []):
+        for task in slot.pop('tasks', []):
+            task['slot_number'] = slot['slot_number']
+            task['position'] = len(tasks_by_id)
+            tasks_by_id[task['id']] = task
+    schedule['tasks_by_id'] = tasks_by_id
+    return True
+
+async def load_schedule(user_id, date_str):
+    """
+    Returns the user's schedule for a date, from the cache if possible.
+    Returns None if no schedule exists for that date yet.
+    """
+    key = (user_id, date_str)
+    schedule = schedule_cache.get(key)
+    if schedule is None:
+        schedule_doc = await get_user_schedule_ref(user_id, date_str).get()
+        if not schedule_doc.exists:
+            return None
+        fetched = schedule_doc.to_dict()
+        upgraded = upgrade_legacy_schedule(fetched)
+        # Another command may have cached it while we were waiting on Firestore
+        schedule = schedule_cache.setdefault(key, fetched)
+        if upgraded and schedule is fetched:
+            mark_schedule_dirty(key) # Save it in the new layout, old 'tasks' lists included
+    return schedule
 
 async def get_or_create_schedule(user_id, start_hour):
     """
-    Fetches today's schedule from Firestore. If it doesn't exist,
+    Fetches today's schedule. If it doesn't exist,
     it creates a new one based on the user's start_hour.
     """
     today_str = get_today_date_str()
-    schedule_ref = get_user_schedule_ref(user_id, today_str)
-    schedule_doc = await asyncio.to_thread(schedule_ref.get)
+    schedule = await load_schedule(user_id, today_str)
+    if schedule is not None:
+        return schedule
+    return create_schedule(user_id, today_str, start_hour)
+
+def create_schedule(user_id, today_str, start_hour):
+    """Creates today's schedule in the cache (unless another command just did) and returns it."""
+    new_schedule = {
+        'date': today_str,
+        'slots': copy.deepcopy(SCHEDULE_TEMPLATES[start_hour]),
+        'tasks_by_id': {} # Task: {id, name, duration, status ('pending', 'in_progress', 'completed'), slot_number, position}
+    }
+
+    key = (user_id, today_str)
+    schedule = schedule_cache.setdefault(key, new_schedule)
+    if schedule is new_schedule:
+        # Not written yet: the next command's flush (or the background flusher) saves it
+        # together with whatever that command changes
+        mark_schedule_dirty(key)
+    return schedule
+
+def merge_schedule_writes(older, newer):
+    """Combines two pending writes for the same schedule into one."""
+    if older is FULL_WRITE or newer is FULL_WRITE:
+        return FULL_WRITE
+    for new_path in newer:
+        for old_path in older:
+            # update() rejects a field path together with one of its parents
+            if new_path != old_path and (new_path.startswith(old_path + '.') or old_path.startswith(new_path + '.')):
+                return FULL_WRITE
+    return {**older, **newer}
+
+def mark_schedule_dirty(key, updates=FULL_WRITE):
+    """
+    Queues a write for a cached schedule. Pass the changed field paths as `updates`
+    to write just those, or leave it out to write the whole document.
+    The cached dict must already contain the change.
+    """
+    if key in dirty_schedules:
+        updates = merge_schedule_writes(dirty_schedules[key], updates)
+    dirty_schedules[key] = updates
+    # The user's /done task list may be out of date now
+    done_options_cache.pop(key[0], None)
 
-    if schedule_doc.exists:
-        return schedule_doc.to_dict()
-    else:
-        # Create a new schedule for today
-        new_schedule = {
-            'date': today_str,
-            'slots': []
-        }
-        current_hour = start_hour
-        for i in range(4):
-            new_schedule['slots'].append({
-                'slot_number': i + 1,
-                'start_hour': current_hour,
-                'total_minutes': 240,
-                'remaining_minutes': 240,
-                'tasks': [] # Task: {id, name, duration, status ('pending', 'in_progress', 'completed')}
-            })
-            current_hour = (current_hour + 4) % 24
-        
-        await asyncio.to_thread(schedule_ref.set, new_schedule)
-        return new_schedule
+async def commit_schedule_writes(batch, pending):
+    """
+    Adds the pending schedule writes to `batch` and commits it.
+    If the commit fails the writes are queued again before the error is raised.
+    """
+    for key, updates in pending:
+        schedule_ref = get_user_schedule_ref(*key)
+        if updates is FULL_WRITE:
+            batch.set(schedule_ref, schedule_cache[key])
+        else:
+            batch.update(schedule_ref, updates)
+
+    try:
+        await batch.commit()
+    except Exception:
+        # Put them back so the next flush retries them (changes made since then win)
+        for key, updates in pending:
+            dirty_schedules[key] = merge_schedule_writes(updates, dirty_schedules.get(key, {}))
+        raise
+
+async def commit_schedule_write(key, updates):
+    """
+    Commits one schedule's write on its own. A partial update of a document that no longer
+    exists is turned into a write of the whole cached schedule.
+    Returns the error if it failed (the write is queued again), otherwise None.
+    """
+    try:
+        await commit_schedule_writes(db.batch(), [(key, updates)])
+    except NotFound as e:
+        if updates is FULL_WRITE:
+            return e
+        # Deleted outside the bot: retrying the same update() would fail forever
+        dirty_schedules.pop(key, None)
+        try:
+            await commit_schedule_writes(db.batch(), [(key, FULL_WRITE)])
+        except Exception as e:
+            return e
+    except Exception as e:
+        return e
+    return None
 
+async def commit_schedule_chunk(chunk):
+    """
+    Commits up to MAX_BATCH_WRITES schedule writes in one batch. A batch is all-or-nothing,
+    so if it fails its writes are retried one per commit and a write that keeps failing
+    only holds up its own schedule.
+    Returns {key: error} for the writes that still failed.
+    """
+    if len(chunk) > 1:
+        try:
+            await commit_schedule_writes(db.batch(), chunk)
+            return {}
+        except Exception:
+            # Take them back out of the queue (with any changes since) and find out which write failed
+            chunk = [(key, dirty_schedules.pop(key)) for key, _ in chunk if key in dirty_schedules]
+    errors = await asyncio.gather(*(commit_schedule_write(key, updates) for key, updates in chunk))
+    return {key: e for (key, _), e in zip(chunk, errors) if e is not None}
+
+def get_schedule_lock(key):
+    """Returns the lock that orders writes to one schedule."""
+    lock = schedule_write_locks.get(key)
+    if lock is None:
+        lock = schedule_write_locks[key] = asyncio.Lock()
+    return lock
+
+async def flush_schedules(keys=None, batch=None):
+    """
+    Writes pending schedule changes to Firestore (all of them, or only those in `keys`)
+    using as few batched commits as possible.
+    Pass a `batch` to commit other writes together with them; errors from that commit are raised.
+    When `keys` are given, a failed write is raised too (it stays queued for the next flush),
+    so commands only report what was actually saved.
+    """
+    flush_all = keys is None
+    if flush_all:
+        # Skip schedules another flush is writing right now, the next run picks up whatever is left
+        keys = [key for key in dirty_schedules if not get_schedule_lock(key).locked()]
+
+    async with contextlib.AsyncExitStack() as stack:
+        # Locks are always taken in sorted order, so two flushes can't deadlock
+        for key in sorted(set(keys)):
+            await stack.enter_async_context(get_schedule_lock(key))
+        pending = [(key, dirty_schedules.pop(key)) for key in keys if key in dirty_schedules]
+
+        if batch is not None:
+            own, rest = pending[:MAX_BATCH_WRITES - 1], pending[MAX_BATCH_WRITES - 1:]
+        else:
+            own, rest = [], pending
+
+        try:
+            if batch is not None:
+                await commit_schedule_writes(batch, own)
+        finally:
+            results = await asyncio.gather(*(
+                commit_schedule_chunk(rest[i:i + MAX_BATCH_WRITES]) for i in range(0, len(rest), MAX_BATCH_WRITES)
+            ))
+            if flush_all:
+                for errors in results:
+                    for key, e in errors.items():
+                        print(f"Error saving schedule {key}: {e}")
+        if not flush_all:
+            failed = [e for errors in results for e in errors.values()]
+            if failed:
+                raise failed[0]
+
+async def schedule_flusher():
+    """Background task that saves schedule changes every few seconds and drops old days from the cache."""
+    while True:
+        await asyncio.sleep(2)
+        await flush_schedules()
+
+        today_str = get_today_date_str()
+        for key in [key for key in schedule_cache if key[1] != today_str and key not in dirty_schedules]:
+            del schedule_cache[key]
+        for key in [key for key, lock in schedule_write_locks.items() if key[1] != today_str and not lock.locked()]:
+            del schedule_write_locks[key]
+
+def fire_and_forget(coro):
+    """Runs a coroutine in the background without waiting for it. Errors are printed, not lost."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+
+    def on_done(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Error in background task: {task.exception()}")
+
+    task.add_done_callback(on_done)
+    return task
+
+def get_ordered_tasks(schedule):
+    """Returns the schedule's tasks ordered by slot, then by the order they were added."""
+    tasks = schedule.get('tasks_by_id', {}).values()
+    return sorted(tasks, key=lambda task: (task['slot_number'], task['position']))
+
+def task_field_path(task_id, *fields):
+    """Returns the update() field path for a task (or one of its fields) in 'tasks_by_id'."""
+    # Task IDs are UUIDs, so the path segment has to be quoted
+    return firestore.FieldPath('tasks_by_id', task_id, *fields).to_api_repr()
+
+@functools.lru_cache(maxsize=24)
 def get_time_range_str(start_hour):
     """Helper to format slot time ranges."""
     end_hour = (start_hour + 4) % 24
     return f"{start_hour:02d}:00 - {end_hour:02d}:00"
 
-async def task_notification_timer(user, task_name, duration_minutes):
-    """The coroutine that waits and then DMs the user."""
-    await asyncio.sleep(duration_minutes * 60)
-    try:
-        await user.send(f"🔔 **Time's up!** Your task **'{task_name}'** is due to end.\n\nDon't forget to mark it as complete with `/done` to log your reflection!")
-    except discord.Forbidden:
-        print(f"Failed to send DM to {user.name} (DMs probably disabled).")
-    except Exception as e:
-        print(f"Error in task_notification_timer: {e}")
-    
-    # Clean up timer from active list
-    timer_key = f"{user.id}_{task_name}" # Note: This simple key might fail if tasks have same name
-    if timer_key in active_timers:
-        del active_timers[timer_key]
+async def dm_worker():
+    """Background task that sends the DMs queued in dm_outbox."""
+    while True:
+        user, message = await dm_outbox.get()
+        try:
+            await user.send(message)
+        except discord.Forbidden:
+            print(f"Failed to send DM to {user.name} (DMs probably disabled).")
+        except Exception as e:
+            print(f"Error in dm_worker: {e}")
+        finally:
+            dm_outbox.task_done()
+
+def start_timer(user, task_id, task_name, duration_minutes):
+    """Starts (or restarts) the timer for a task."""
+    fire_at = time.monotonic() + duration_minutes * 60
+    active_timers[(user.id, task_id)] = (fire_at, user, task_name)
+    heapq.heappush(timer_heap, (fire_at, user.id, task_id))
+    timer_heap_changed.set() # It may be the new earliest timer
+
+def cancel_timer(user_id, task_id):
+    """Cancels a task's timer, if it has one."""
+    active_timers.pop((user_id, task_id), None)
+
+async def timer_loop():
+    """Background task that fires task timers as they come due."""
+    while True:
+        timer_heap_changed.clear()
+        if not timer_heap:
+            await timer_heap_changed.wait()
+            continue
+
+        delay = timer_heap[0][0] - time.monotonic()
+        if delay > 0:
+            # Wake up when the earliest timer is due, or earlier if a new timer goes in front of it
+            try:
+                await asyncio.wait_for(timer_heap_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        fire_at, user_id, task_id = heapq.heappop(timer_heap)
+        timer = active_timers.get((user_id, task_id))
+        if timer is None or timer[0] != fire_at:
+            continue # Cancelled or restarted since this entry was pushed
+        _, user, task_name = timer
+        await task_notification_timer(user, task_id, task_name)
+
+async def task_notification_timer(user, task_id, task_name):
+    """Called by timer_loop when a task's time is up. DMs the user."""
+    # Clean up timer from active list first: put() waits while the outbox is full,
+    # and the user may restart this task's timer in the meantime
+    active_timers.pop((user.id, task_id), None)
+
+    await dm_outbox.put((user, f"🔔 **Time's up!** Your task **'{task_name}'** is due to end.\n\nDon't forget to mark it as complete with `/done` to log your reflection!"))
 
 
 # --- Bot Modals (Pop-up Forms) ---
@@ -174,7 +600,13 @@ class SetupModal(discord.ui.Modal, title='Welcome! Let\'s get you set up.'):
         }
         
         config_ref = get_user_config_ref(interaction.user.id)
-        await asyncio.to_thread(config_ref.set, config_data)
+        batch = db.batch()
+        batch.set(config_ref, config_data)
+
+        # Create today's schedule if needed and save it in the same commit as the config
+        schedule_data = await get_or_create_schedule(interaction.user.id, hour)
+        await flush_schedules([(interaction.user.id, schedule_data['date'])], batch=batch)
+        config_cache[interaction.user.id] = config_data
         
         await interaction.response.send_message(
             f"🎉 **Setup complete!**\n\n"
@@ -186,10 +618,11 @@ class SetupModal(discord.ui.Modal, title='Welcome! Let\'s get you set up.'):
         )
 
 class ReflectionModal(discord.ui.Modal, title='Task Reflection'):
-    def __init__(self, task_id, schedule_ref):
+    def __init__(self, task_id, schedule_key, schedule=None):
         super().__init__()
         self.task_id = task_id
-        self.schedule_ref = schedule_ref
+        self.schedule_key = schedule_key
+        self.schedule = schedule # The caller's copy of the schedule, if it already has one
 
     difficulties = discord.ui.TextInput(
         label='What difficulties were encountered?',
@@ -222,30 +655,28 @@ class ReflectionModal(discord.ui.Modal, title='Task Reflection'):
         
         # We need to find the task in the schedule and update it
         try:
-            doc = await asyncio.to_thread(self.schedule_ref.get)
-            if not doc.exists:
+            schedule = self.schedule
+            if schedule is None:
+                schedule = await load_schedule(*self.schedule_key)
+            if schedule is None:
                 await interaction.response.send_message("Error: Could not find schedule.", ephemeral=True)
                 return
 
-            schedule = doc.to_dict()
-            task_found = False
-            for slot in schedule['slots']:
-                for task in slot['tasks']:
-                    if task['id'] == self.task_id:
-                        task['status'] = 'completed'
-                        task['reflection'] = reflection_data
-                        task_found = True
-                        break
-                if task_found:
-                    break
-            
-            if task_found:
-                # Save the entire schedule back
-                await asyncio.to_thread(self.schedule_ref.set, schedule)
-                await interaction.response.send_message(f"Reflection saved! Task marked as complete.", ephemeral=True)
-            else:
+            task = schedule.get('tasks_by_id', {}).get(self.task_id)
+            if not task:
                 await interaction.response.send_message(f"Error: Could not find the task to save reflection.", ephemeral=True)
-                
+                return
+
+            task['status'] = 'completed'
+            task['reflection'] = reflection_data
+            # Only this task's fields are written, not the whole schedule
+            mark_schedule_dirty(self.schedule_key, {
+                task_field_path(self.task_id, 'status'): 'completed',
+                task_field_path(self.task_id, 'reflection'): reflection_data
+            })
+            await flush_schedules([self.schedule_key])
+            await interaction.response.send_message(f"Reflection saved! Task marked as complete.", ephemeral=True)
+
         except Exception as e:
             print(f"Error saving reflection: {e}")
             await interaction.response.send_message(f"An error occurred while saving: {e}", ephemeral=True)
@@ -260,8 +691,10 @@ class CheckInView(discord.ui.View):
         self.positive_habits = config.get('positive_habits', [])
         self.negative_habits = config.get('negative_habits', [])
         self.all_habits = [(h, 'pos') for h in self.positive_habits] + [(h, 'neg') for h in self.negative_habits]
+        # Question prefixes only depend on the habit, so work them out once
+        self.prefixes = [self._compute_prefix(h, t) for (h, t) in self.all_habits]
         self.current_index = 0
-        self.answers = {}
+        self.answers = [None] * len(self.all_habits) # answers[i] is the answer for all_habits[i]
         self.message = None
 
     async def start(self, interaction: discord.Interaction):
@@ -279,25 +712,18 @@ class CheckInView(discord.ui.View):
         except discord.Forbidden:
             await interaction.followup.send("I can't DM you! Please enable DMs from server members.", ephemeral=True)
 
-    def get_question_text(self):
-        """Gets the text for the current question."""
-        habit, habit_type = self.all_habits[self.current_index]
-        prefix = "Did you" if habit_type == 'pos' else "Did you avoid"
+    @staticmethod
+    def _compute_prefix(habit, habit_type):
+        """Picks the question prefix for a habit."""
+        lowered = habit.lower()
         if habit_type == 'pos':
-            # Customize common positive habits
-            if "gym" in habit.lower():
-                prefix = "Did you go to the"
-            elif "meditate" in habit.lower():
-                prefix = "Did you"
-            elif "protein" in habit.lower():
-                prefix = "Did you take your"
-        else:
-            # Customize common negative habits
-            if "smoke" in habit.lower():
-                prefix = "Did you avoid"
-            elif "sugary" in habit.lower():
-                prefix = "Did you avoid"
+            return next((prefix for keyword, prefix in POSITIVE_HABIT_PREFIXES.items() if keyword in lowered), "Did you")
+        return next((prefix for keyword, prefix in NEGATIVE_HABIT_PREFIXES.items() if keyword in lowered), "Did you avoid")
 
+    def get_question_text(self):
+        """Gets the text for the current question."""
+        habit, _ = self.all_habits[self.current_index]
+        prefix = self.prefixes[self.current_index]
         return f"**Question {self.current_index + 1} of {len(self.all_habits)}**\n\n{prefix} **{habit}** today?"
 
     async def next_question(self, interaction: discord.Interaction):
@@ -317,7 +743,11 @@ class CheckInView(discord.ui.View):
         # Save habit data to Firestore
         today_str = get_today_date_str()
         habits_ref = get_user_habits_ref(self.user.id, today_str)
-        await asyncio.to_thread(habits_ref.set, self.answers)
+        habits_data = {'positive_habits': {}, 'negative_habits': {}}
+        for (habit, habit_type), answered_yes in zip(self.all_habits, self.answers):
+            group = 'positive_habits' if habit_type == 'pos' else 'negative_habits'
+            habits_data[group][habit] = answered_yes
+        await habits_ref.set(habits_data)
         
         await self.user.send(
             "Great job!\n\n"
@@ -325,9 +755,14 @@ class CheckInView(discord.ui.View):
             "Write your journal entry below. I'll wait for 10 minutes."
         )
 
+        # Resolve the IDs once, the check runs for every message the bot receives
+        dm_channel = self.user.dm_channel or await self.user.create_dm()
+        user_id = self.user.id
+        dm_channel_id = dm_channel.id
+
         def check(m):
             # Check if the message is from the same user and in the same DM channel
-            return m.author.id == self.user.id and m.channel.id == self.user.dm_channel.id
+            return m.author.id == user_id and m.channel.id == dm_channel_id
 
         try:
             # Wait for the user's journal entry
@@ -347,13 +782,11 @@ class CheckInView(discord.ui.View):
     async def generate_and_post_summary(self, journal_text):
         """Generates the daily summary and posts it to the journal channel."""
         # 1. Get user config for journal channel
-        config_ref = get_user_config_ref(self.user.id)
-        config_doc = await asyncio.to_thread(config_ref.get)
-        if not config_doc.exists:
+        config = await load_config(self.user.id)
+        if config is None:
             await self.user.send("I can't find your config! Please use `/setup` again.")
             return
         
-        config = config_doc.to_dict()
         journal_channel_id = config.get('journal_channel_id')
         channel = bot.get_channel(journal_channel_id)
         if not channel:
@@ -363,41 +796,29 @@ class CheckInView(discord.ui.View):
         # 2. Analyze answers
         total_habits = len(self.all_habits)
         score = 0
-        scoreboard = ""
+        scoreboard_lines = []
         
-        for (habit, habit_type), answered_yes in self.answers.items():
+        for i, answered_yes in enumerate(self.answers):
+            habit, habit_type = self.all_habits[i]
             if habit_type == 'pos' and answered_yes:
                 score += 1
-                scoreboard += f"✅ {habit}\n"
+                scoreboard_lines.append(f"✅ {habit}")
             elif habit_type == 'pos' and not answered_yes:
-                scoreboard += f"❌ {habit}\n"
+                scoreboard_lines.append(f"❌ {habit}")
             elif habit_type == 'neg' and not answered_yes: # Not answering yes == avoiding
                 score += 1
-                scoreboard += f"✅ Avoided {habit}\n"
+                scoreboard_lines.append(f"✅ Avoided {habit}")
             elif habit_type == 'neg' and answered_yes:
-                scoreboard += f"❌ Indulged in {habit}\n"
+                scoreboard_lines.append(f"❌ Indulged in {habit}")
+
+        scoreboard = "\n".join(scoreboard_lines) + "\n" if scoreboard_lines else ""
 
         percentage = (score / total_habits) * 100 if total_habits > 0 else 0
 
         # 3. Generate Title and Summary
-        if percentage == 100:
-            status_title = "The Pinnacle of Discipline"
-            summary_text = f"{self.user.name} had a perfect day, demonstrating flawless discipline. They completed all {total_habits} goals, remaining steadfast and focused. An outstanding performance."
-        elif percentage >= 80:
-            status_title = "The Master Practitioner"
-            summary_text = f"{self.user.name} showed exceptional focus, achieving {score}/{total_habits} of their goals. A few minor slips couldn't overshadow a day of strong commitment and progress."
-        elif percentage >= 60:
-            status_title = "The Steady Hand"
-            summary_text = f"{self.user.name} had a solid day. With {score}/{total_habits} habits completed, they built positive momentum and successfully navigated most of the day's challenges."
-        elif percentage >= 40:
-            status_title = "A Day of Mixed Results"
-            summary_text = f"{self.user.name}'s day was a mix of wins and challenges, hitting {score}/{total_habits} targets. This day provides valuable lessons on what to focus on tomorrow."
-        elif percentage > 0:
-            status_title = "The Uphill Battle"
-            summary_text = f"{self.user.name} struggled with focus today, completing {score}/{total_habits} habits. While it was a tough day, every completed habit is a small victory to build on."
-        else:
-            status_title = "The Day of Reflection"
-            summary_text = f"It was a challenging day for {self.user.name}, with {score}/{total_habits} habits met. Today is best used as a day of rest and reflection to come back stronger tomorrow."
+        tier = SUMMARY_TIERS[bisect_right(SUMMARY_TIER_THRESHOLDS, percentage) - 1]
+        _, status_title, summary_template = tier
+        summary_text = summary_template.format(name=self.user.name, score=score, total=total_habits)
 
         # 4. Create Embed
         embed = discord.Embed(
@@ -423,14 +844,12 @@ class CheckInView(discord.ui.View):
 
     @discord.ui.button(label='Yes', style=discord.ButtonStyle.green)
     async def yes_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        current_habit = self.all_habits[self.current_index]
-        self.answers[current_habit] = True
+        self.answers[self.current_index] = True
         await self.next_question(interaction)
 
     @discord.ui.button(label='No', style=discord.ButtonStyle.red)
     async def no_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        current_habit = self.all_habits[self.current_index]
-        self.answers[current_habit] = False
+        self.answers[self.current_index] = False
         await self.next_question(interaction)
 
     async def on_timeout(self):
@@ -439,7 +858,54 @@ class CheckInView(discord.ui.View):
             await self.message.edit(content="Your check-in timed out. Please use `/checkin` to try again.", view=None)
 
 
+class CompleteTaskView(discord.ui.View):
+    """The task picker sent by /done. Opens the reflection modal for the chosen task."""
+    def __init__(self, interaction, options, schedule):
+        super().__init__()
+        self.interaction = interaction # The /done interaction this view was sent for
+        self.schedule = schedule # The schedule the options were built from
+        # discord.py needs a fresh Select per message, the options can be shared
+        self.select = discord.ui.Select(placeholder="Choose a task to complete...", options=list(options))
+        self.select.callback = self.on_select
+        self.add_item(self.select)
+
+    async def on_select(self, select_interaction: discord.Interaction):
+        """Callback for when a task is selected to complete."""
+        user_id = self.interaction.user.id
+        task_id = select_interaction.data['values'][0]
+        done_options_cache.pop(user_id, None)
+        
+        # Cancel any active timer for this task
+        cancel_timer(user_id, task_id)
+        
+        # Reuse the schedule the task list was built from
+        schedule_key = (user_id, self.schedule['date'])
+        
+        # Disable the view first, so the edit is already in flight while the modal is sent
+        self.stop()
+        fire_and_forget(self.interaction.edit_original_response(view=self))
+
+        # Send the reflection modal
+        modal = ReflectionModal(task_id=task_id, schedule_key=schedule_key, schedule=self.schedule)
+        await select_interaction.response.send_modal(modal)
+
+
 # --- Bot Events ---
+@bot.event
+async def setup_hook():
+    # Runs once before the bot connects, unlike on_ready which fires again on every reconnect
+    global dm_outbox, timer_heap_changed
+    # Eager tasks run synchronously until their first real suspension (Python 3.12+)
+    if hasattr(asyncio, 'eager_task_factory'):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+    # Before Python 3.10, asyncio primitives bind to the loop that exists when they're created
+    dm_outbox = asyncio.Queue(maxsize=DM_OUTBOX_SIZE)
+    timer_heap_changed = asyncio.Event()
+
+    for coro in (schedule_flusher(), timer_loop(), *(dm_worker() for _ in range(DM_WORKERS))):
+        background_tasks.add(asyncio.create_task(coro))
+
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user} (ID: {bot.user.id})')
@@ -452,6 +918,14 @@ async def on_ready():
         print(f'Error syncing commands: {e}')
     print('------')
 
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, SetupRequired):
+        await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
+        return
+    # Anything else gets discord.py's default handling (logging the traceback)
+    await app_commands.CommandTree.on_error(bot.tree, interaction, error)
+
 # --- Bot Commands ---
 
 @bot.tree.command(name="setup", description="Configure your schedule, habits, and journal.")
@@ -460,21 +934,19 @@ async def setup(interaction: discord.Interaction):
     await interaction.response.send_modal(SetupModal())
 
 @bot.tree.command(name="schedule", description="View your 4-slot schedule for today.")
+@requires_setup()
 async def schedule(interaction: discord.Interaction):
     """Displays today's schedule in an embed."""
-    config_ref = get_user_config_ref(interaction.user.id)
-    config_doc = await asyncio.to_thread(config_ref.get)
-    if not config_doc.exists:
-        await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
-        return
+    config = interaction.extras['config']
+    schedule_data = interaction.extras['schedule']
     
-    config = config_doc.to_dict()
     start_hour = config.get('start_hour')
     
     await interaction.response.defer(ephemeral=True) # Defer while we fetch/create
     
     try:
-        schedule_data = await get_or_create_schedule(interaction.user.id, start_hour)
+        if schedule_data is None:
+            schedule_data = create_schedule(interaction.user.id, get_today_date_str(), start_hour)
         
         embed = discord.Embed(
             title=f"Today's Schedule ({schedule_data['date']})",
@@ -485,19 +957,26 @@ async def schedule(interaction: discord.Interaction):
         if not schedule_data.get('slots'):
              embed.description = "No slots found. Something is wrong with your schedule."
         else:
+            # Group the tasks by slot in one pass
+            tasks_by_slot = {}
+            for task in get_ordered_tasks(schedule_data):
+                tasks_by_slot.setdefault(task['slot_number'], []).append(task)
+
             for slot in schedule_data['slots']:
                 time_range = get_time_range_str(slot['start_hour'])
-                task_list_str = ""
-                if not slot['tasks']:
+                slot_tasks = tasks_by_slot.get(slot['slot_number'], [])
+                if not slot_tasks:
                     task_list_str = "*Empty*"
                 else:
-                    for task in slot['tasks']:
+                    task_lines = []
+                    for task in slot_tasks:
                         status_emoji = "◻️" # pending
                         if task['status'] == 'in_progress':
                             status_emoji = "▶️"
                         elif task['status'] == 'completed':
                             status_emoji = "✅"
-                        task_list_str += f"{status_emoji} {task['name']} ({task['duration']}m)\n"
+                        task_lines.append(f"{status_emoji} {task['name']} ({task['duration']}m)")
+                    task_list_str = "\n".join(task_lines) + "\n"
                 
                 embed.add_field(
                     name=f"Slot {slot['slot_number']} ({time_range})",
@@ -514,21 +993,26 @@ async def schedule(interaction: discord.Interaction):
 
 @bot.tree.command(name="addtask", description="Add a new task to your schedule.")
 @app_commands.describe(name="The name of the task", duration="The duration of the task in minutes")
+@requires_setup()
 async def addtask(interaction: discord.Interaction, name: str, duration: int):
     """Adds a task to the next available slot."""
-    config_ref = get_user_config_ref(interaction.user.id)
-    config_doc = await asyncio.to_thread(config_ref.get)
-    if not config_doc.exists:
-        await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
-        return
+    config = interaction.extras['config']
+    schedule_data = interaction.extras['schedule']
     
-    config = config_doc.to_dict()
     start_hour = config.get('start_hour')
     
     await interaction.response.defer(ephemeral=True)
     
     try:
-        schedule_data = await get_or_create_schedule(interaction.user.id, start_hour)
+        if schedule_data is None:
+            schedule_data = create_schedule(interaction.user.id, get_today_date_str(), start_hour)
+        
+        new_task = {
+            'id': str(uuid.uuid4()), # Unique ID for every task
+            'name': name,
+            'duration': duration,
+            'status': 'pending'
+        }
         
         slot_found = None
         for slot in schedule_data['slots']:
@@ -537,18 +1021,19 @@ async def addtask(interaction: discord.Interaction, name: str, duration: int):
                 break
         
         if slot_found:
-            new_task = {
-                'id': str(uuid.uuid4()), # Unique ID for every task
-                'name': name,
-                'duration': duration,
-                'status': 'pending'
-            }
-            slot_found['tasks'].append(new_task)
+            new_task['slot_number'] = slot_found['slot_number']
+            tasks_by_id = schedule_data.setdefault('tasks_by_id', {})
+            new_task['position'] = len(tasks_by_id)
+            tasks_by_id[new_task['id']] = new_task
             slot_found['remaining_minutes'] -= duration
             
-            # Save the updated schedule
-            schedule_ref = get_user_schedule_ref(interaction.user.id, schedule_data['date'])
-            await asyncio.to_thread(schedule_ref.set, schedule_data)
+            # Save the slot totals and the new task, not the whole schedule
+            schedule_key = (interaction.user.id, schedule_data['date'])
+            mark_schedule_dirty(schedule_key, {
+                'slots': schedule_data['slots'],
+                task_field_path(new_task['id']): new_task
+            })
+            await flush_schedules([schedule_key])
             
             time_range = get_time_range_str(slot_found['start_hour'])
             await interaction.followup.send(
@@ -567,26 +1052,23 @@ async def addtask(interaction: discord.Interaction, name: str, duration: int):
 
 
 @bot.tree.command(name="starttask", description="Start a timer for one of your pending tasks.")
+@requires_setup()
 async def starttask(interaction: discord.Interaction):
     """Shows a dropdown of pending tasks to start."""
-    config_ref = get_user_config_ref(interaction.user.id)
-    config_doc = await asyncio.to_thread(config_ref.get)
-    if not config_doc.exists:
-        await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
-        return
+    config = interaction.extras['config']
+    schedule_data = interaction.extras['schedule']
 
-    config = config_doc.to_dict()
     start_hour = config.get('start_hour')
     
     await interaction.response.defer(ephemeral=True)
     
-    schedule_data = await get_or_create_schedule(interaction.user.id, start_hour)
+    if schedule_data is None:
+        schedule_data = create_schedule(interaction.user.id, get_today_date_str(), start_hour)
     
     pending_tasks = []
-    for slot in schedule_data['slots']:
-        for task in slot['tasks']:
-            if task['status'] == 'pending':
-                pending_tasks.append(task)
+    for task in get_ordered_tasks(schedule_data):
+        if task['status'] == 'pending':
+            pending_tasks.append(task)
     
     if not pending_tasks:
         await interaction.followup.send("You have no pending tasks to start!", ephemeral=True)
@@ -604,46 +1086,34 @@ async def starttask(interaction: discord.Interaction):
         task_id = select_interaction.data['values'][0]
         
         # Find the task in the schedule again
-        doc = await asyncio.to_thread(get_user_schedule_ref(interaction.user.id, get_today_date_str()).get)
-        schedule = doc.to_dict()
-        
-        task_to_start = None
-        task_found = False
-        for slot in schedule['slots']:
-            for task in slot['tasks']:
-                if task['id'] == task_id:
-                    task_to_start = task
-                    task['status'] = 'in_progress' # Mark as in progress
-                    task_found = True
-                    break
-            if task_found:
-                break
+        schedule_key = (interaction.user.id, get_today_date_str())
+        schedule = await load_schedule(*schedule_key) or {}
         
+        task_to_start = schedule.get('tasks_by_id', {}).get(task_id)
         if not task_to_start:
             await select_interaction.response.send_message("Error: Task not found.", ephemeral=True)
             return
 
-        # Save the "in_progress" status
-        schedule_ref = get_user_schedule_ref(interaction.user.id, get_today_date_str())
-        await asyncio.to_thread(schedule_ref.set, schedule)
+        task_to_start['status'] = 'in_progress' # Mark as in progress
 
-        # Start the notification timer
-        timer_key = f"{interaction.user.id}_{task_to_start['id']}"
-        if timer_key in active_timers:
-            active_timers[timer_key].cancel() # Cancel old timer if any
-            
-        timer_task = asyncio.create_task(
-            task_notification_timer(interaction.user, task_to_start['name'], task_to_start['duration'])
-        )
-        active_timers[timer_key] = timer_task
-        
+        # Start the notification timer (replaces the old timer if any)
+        start_timer(interaction.user, task_id, task_to_start['name'], task_to_start['duration'])
+
+        # Save the "in_progress" status before replying, so the reply matches what was saved
+        mark_schedule_dirty(schedule_key, {task_field_path(task_id, 'status'): 'in_progress'})
+        try:
+            await flush_schedules([schedule_key])
+        except Exception as e:
+            print(f"Error in /starttask: {e}")
+            await select_interaction.response.send_message(f"An error occurred while saving: {e}", ephemeral=True)
+            return
         await select_interaction.response.send_message(
             f"▶️ Timer started for **'{task_to_start['name']}'** ({task_to_start['duration']}m). I'll DM you when it's over!",
             ephemeral=True
         )
-        # Disable the view
+        # Disable the view (the user doesn't wait on this, so don't block the callback)
         view.stop()
-        await interaction.edit_original_response(view=view)
+        fire_and_forget(interaction.edit_original_response(view=view))
 
 
     select.callback = select_callback
@@ -653,76 +1123,47 @@ async def starttask(interaction: discord.Interaction):
 
 
 @bot.tree.command(name="done", description="Mark a task as completed and write a reflection.")
+@requires_setup()
 async def done(interaction: discord.Interaction):
     """Shows a dropdown of 'in_progress' or 'pending' tasks to complete."""
-    config_ref = get_user_config_ref(interaction.user.id)
-    config_doc = await asyncio.to_thread(config_ref.get)
-    if not config_doc.exists:
-        await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
-        return
+    config = interaction.extras['config']
+    schedule_data = interaction.extras['schedule']
 
-    config = config_doc.to_dict()
     start_hour = config.get('start_hour')
     
     await interaction.response.defer(ephemeral=True)
     
-    schedule_data = await get_or_create_schedule(interaction.user.id, start_hour)
+    if schedule_data is None:
+        schedule_data = create_schedule(interaction.user.id, get_today_date_str(), start_hour)
     
-    tasks_to_complete = []
-    for slot in schedule_data['slots']:
-        for task in slot['tasks']:
+    options = done_options_cache.get(interaction.user.id)
+    if options is None:
+        tasks_to_complete = []
+        for task in get_ordered_tasks(schedule_data):
             if task['status'] in ['pending', 'in_progress']:
                 tasks_to_complete.append(task)
+
+        options = []
+        for task in tasks_to_complete[:25]: # Max 25 options
+            options.append(discord.SelectOption(label=f"{task['name']} ({task['duration']}m)", value=task['id']))
+        done_options_cache[interaction.user.id] = options
     
-    if not tasks_to_complete:
+    if not options:
         await interaction.followup.send("You have no tasks to mark as complete!", ephemeral=True)
         return
 
-    # Create a select menu
-    options = []
-    for task in tasks_to_complete[:25]: # Max 25 options
-        options.append(discord.SelectOption(label=f"{task['name']} ({task['duration']}m)", value=task['id']))
-
-    select = discord.ui.Select(placeholder="Choose a task to complete...", options=options)
-
-    async def select_callback(select_interaction: discord.Interaction):
-        """Callback for when a task is selected to complete."""
-        task_id = select_interaction.data['values'][0]
-        
-        # Cancel any active timer for this task
-        timer_key = f"{interaction.user.id}_{task_id}"
-        if timer_key in active_timers:
-            active_timers[timer_key].cancel()
-            del active_timers[timer_key]
-        
-        schedule_ref = get_user_schedule_ref(interaction.user.id, get_today_date_str())
-        
-        # Send the reflection modal
-        modal = ReflectionModal(task_id=task_id, schedule_ref=schedule_ref)
-        await select_interaction.response.send_modal(modal)
-
-        # Disable the view
-        view.stop()
-        await interaction.edit_original_response(view=view)
-
-
-    select.callback = select_callback
-    view = discord.ui.View()
-    view.add_item(select)
+    view = CompleteTaskView(interaction, options, schedule_data)
     await interaction.followup.send("Which task did you complete?", view=view, ephemeral=True)
 
 
 @bot.tree.command(name="checkin", description="Start your interactive daily check-in and journal.")
 async def checkin(interaction: discord.Interaction):
     """Starts the daily check-in process in DMs."""
-    config_ref = get_user_config_ref(interaction.user.id)
-    config_doc = await asyncio.to_thread(config_ref.get)
-    if not config_doc.exists:
+    config = await load_config(interaction.user.id)
+    if config is None:
         await interaction.response.send_message("You must run `/setup` first!", ephemeral=True)
         return
     
-    config = config_doc.to_dict()
-    
     # Create the view
     view = CheckInView(user=interaction.user, config=config)
     # Start the process. This will send its own ephemeral response
@@ -731,8 +1172,27 @@ async def checkin(interaction: discord.Interaction):
 
 
 # --- Run the Bot ---
+async def main():
+    async with bot:
+        await bot.start(DISCORD_TOKEN)
+
 if __name__ == "__main__":
-    if DISCORD_TOKEN:
+    # DISCORD_TOKEN was already checked at import time, before anything else was set up
+    # uvloop is optional (not available on Windows), but gives a faster event loop when installed
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+
+    if uvloop is None:
+        bot.run(DISCORD_TOKEN)
+    elif sys.version_info < (3, 11):
+        uvloop.install() # Only deprecated from 3.12 on, and asyncio.Runner doesn't exist yet
         bot.run(DISCORD_TOKEN)
     else:
-        print("Bot token not found. Please set DISCORD_TOKEN in your .env file.")
\ No newline at end of file
+        discord.utils.setup_logging() # bot.run() would normally do this for us
+        try:
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+                runner.run(main())
+        except KeyboardInterrupt:
+            pass # Same as bot.run(): Ctrl+C just shuts the bot down